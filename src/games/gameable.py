@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
+import copy
 import json
 import logging
 import os
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
+import numpy as np
 import pandas as pd
 from src.conversation.conversation_log import conversation_log
 from src.conversation.context import context
@@ -16,6 +18,10 @@ import soundfile as sf
 import threading
 import wave
 import shutil
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 class gameable(ABC):
     """Abstract class for different implementations of games to support. 
@@ -35,12 +41,15 @@ class gameable(ABC):
         except:
             logging.error(f'Unable to read / open {path_to_character_df}. If you have recently edited this file, please try reverting to a previous version. This error is normally due to using special characters, or saving the CSV in an incompatible format.')
             input("Press Enter to exit.")
+        self._col_pos: dict[str, int] = {column: position for position, column in enumerate(self.__character_df.columns)}
+        self._prepare_match_index()
+        self._info_cache: dict[tuple[str, str, str, int, str], tuple[dict[str, Any], bool]] = {}
         
         self._is_vr: bool = 'vr' in config.game.lower()
         #Apply character overrides
-        mod_overrides_folder = os.path.join(*[config.mod_path_base, self.extender_name, "Plugins","MantellaSoftware","data",f"{mantella_game_folder_path}","character_overrides"])
+        mod_overrides_folder = Path(config.mod_path_base, self.extender_name, "Plugins", "MantellaSoftware", "data", mantella_game_folder_path, "character_overrides")
         self.__apply_character_overrides(mod_overrides_folder, self.__character_df.columns.values.tolist())
-        personal_overrides_folder = os.path.join(config.save_folder, f"data/{mantella_game_folder_path}/character_overrides")     
+        personal_overrides_folder = Path(config.save_folder, "data", mantella_game_folder_path, "character_overrides")     
         self.__apply_character_overrides(personal_overrides_folder, self.__character_df.columns.values.tolist())
 
         self.__conversation_folder_path = config.save_folder + f"data/{mantella_game_folder_path}/conversations"
@@ -84,7 +93,7 @@ class gameable(ABC):
     @utils.time_it
     def __get_character_df(self, file_name: str) -> pd.DataFrame:
         encoding = utils.get_file_encoding(file_name)
-        character_df = pd.read_csv(file_name, engine='python', encoding=encoding)
+        character_df = pd.read_csv(file_name, engine='c', encoding=encoding, dtype=str, na_filter=False) # read everything as text, empty cells become ''
 
         return character_df
     
@@ -172,126 +181,274 @@ class gameable(ABC):
         pass
 
     @utils.time_it
-    def _get_matching_df_rows_matcher(self, base_id: str, character_name: str, race: str) -> pd.Series | None:
-        character_name_lower = character_name.lower()
-        race_lower = race.lower()
-        
-        full_id_len = 6
-        full_id_search = base_id[-full_id_len:].lstrip('0')  # Strip leading zeros from the last 6 characters
+    def _prepare_match_index(self):
+        """Precomputes the normalized (lowercase, leading zeros stripped) columns used by `_get_matching_df_rows_matcher`
+        and indexes the row positions by name, full ID and partial IDs.
+        Needs to be rerun whenever the character_df has been modified
+        """
+        base_ids: np.ndarray = self.__normalized_column('base_id')
+        # The matching columns are kept as separate contiguous arrays so lookups never have to go through the DataFrame
+        self._match_cols: dict[str, np.ndarray] = {
+            'base_id': base_ids,
+            'base_id_norm': np.char.lstrip(base_ids, '0'),
+            'name': self.__normalized_column('name'),
+            'race': self.__normalized_column('race'),
+        }
+        self._by_name: dict[str, list[int]] = self.__group_row_indices(self._match_cols['name'])
+        self._by_id_full: dict[str, list[int]] = self.__group_row_indices(self._match_cols['base_id_norm'])
+        # Races are shared by many rows, so they are kept as sets to intersect the name and ID candidates with
+        self._by_race: dict[str, set[int]] = {race: set(rows) for race, rows in self.__group_row_indices(self._match_cols['race']).items()}
+        # Most lookups are resolved by name and full ID, which only works if the combination is unique
+        self._by_name_id: dict[tuple[str, str], list[int]] = {}
+        for row_index, name_id in enumerate(zip(self._match_cols['name'].tolist(), self._match_cols['base_id_norm'].tolist())):
+            self._by_name_id.setdefault(name_id, []).append(row_index)
+        # Partial ID indexes are only built once a lookup gets to the partial ID matchers, see `__get_partial_id_rows`
+        self._by_id_suffix: dict[int, dict[str, list[int]]] = {}
+        # Lowercase base ID, name and race of rows that have been added or changed since _match_cols was built
+        self._row_keys: dict[int, tuple[str, str, str]] = {}
+
+    def __row_match_keys(self, row_index: int) -> tuple[str, str, str]:
+        """Returns the lowercase base ID, name and race a row is currently indexed under"""
+        if row_index in self._row_keys:
+            return self._row_keys[row_index]
+        return str(self._match_cols['base_id'][row_index]), str(self._match_cols['name'][row_index]), str(self._match_cols['race'][row_index])
+
+    def __index_row(self, row_index: int, base_id_lower: str, name_lower: str, race_lower: str):
+        """Adds a row to the match index under the given keys,
+        so that lookups already find it before the DataFrame and the index are rebuilt
+        """
+        base_id_norm = base_id_lower.lstrip('0')
+        self._by_name.setdefault(name_lower, []).append(row_index)
+        self._by_id_full.setdefault(base_id_norm, []).append(row_index)
+        self._by_race.setdefault(race_lower, set()).add(row_index)
+        self._by_name_id.setdefault((name_lower, base_id_norm), []).append(row_index)
+        for length, by_id_suffix in self._by_id_suffix.items():
+            by_id_suffix.setdefault(self.__id_suffix(base_id_lower, length), []).append(row_index)
+        self._row_keys[row_index] = (base_id_lower, name_lower, race_lower)
+
+    def __unindex_row(self, row_index: int):
+        """Removes a row from the match index under the keys it is currently indexed under"""
+        base_id_lower, name_lower, race_lower = self.__row_match_keys(row_index)
+        base_id_norm = base_id_lower.lstrip('0')
+        self.__remove_from_group(self._by_name, name_lower, row_index)
+        self.__remove_from_group(self._by_id_full, base_id_norm, row_index)
+        self._by_race[race_lower].discard(row_index)
+        self.__remove_from_group(self._by_name_id, (name_lower, base_id_norm), row_index)
+        for length, by_id_suffix in self._by_id_suffix.items():
+            self.__remove_from_group(by_id_suffix, self.__id_suffix(base_id_lower, length), row_index)
+
+    def __reindex_row(self, row_index: int, changes: dict[str, Any]):
+        """Moves a row to the keys of its changed base ID, name or race, so that later lookups find it by its new values"""
+        if not ('base_id' in changes or 'name' in changes or 'race' in changes):
+            return
+        base_id_lower, name_lower, race_lower = self.__row_match_keys(row_index)
+        self.__unindex_row(row_index)
+        self.__index_row(row_index,
+                         str(changes['base_id']).lower() if 'base_id' in changes else base_id_lower,
+                         str(changes['name']).lower() if 'name' in changes else name_lower,
+                         str(changes['race']).lower() if 'race' in changes else race_lower)
 
-        # Function to remove leading zeros from hexadecimal ID strings
-        def vectorized_remove_zeros(series):
-            return series.fillna('').astype(str).str.lstrip('0')
-        
-        def vectorized_partial_id_match(series, length):
-            str_series = series.fillna('').astype(str)
-            # Create mask for strings long enough
-            length_mask = str_series.str.len() >= length
-            # Apply different logic based on length
-            result = pd.Series('', index=series.index)  # Default to empty string
-            result[length_mask] = str_series[length_mask].str[-length:].str.lstrip('0')
-            result[~length_mask] = str_series[~length_mask].str.lstrip('0')
-            return result.str.lower()
-
-        df_id_cleaned = vectorized_remove_zeros(self.character_df['base_id']).str.lower()
-        id_match = df_id_cleaned == full_id_search.lower()
-        name_match = self.character_df['name'].astype(str).str.lower() == character_name_lower
-
-        race_match = self.character_df['race'].astype(str).str.lower() == race_lower
-
-        # Partial ID match with decreasing lengths
-        partial_id_match = pd.Series(False, index=self.character_df.index)
+    @staticmethod
+    def __remove_from_group(groups: dict[Any, list[int]], key: Any, row_index: int):
+        rows = groups[key]
+        rows.remove(row_index)
+        if not rows:
+            del groups[key]
+
+    @staticmethod
+    def __id_suffix(base_id_lower: str, length: int) -> str:
+        """Returns the last `length` characters of a single ID with leading zeros stripped, see `__id_suffixes`"""
+        return base_id_lower[-length:].lstrip('0')
+
+    @staticmethod
+    def __id_suffixes(base_ids: np.ndarray, length: int) -> np.ndarray:
+        """Returns the last `length` characters of every ID with leading zeros stripped, without leaving numpy.
+        IDs are padded with zeros to a common width first, so shorter IDs keep their full value
+        """
+        width = max(base_ids.dtype.itemsize // np.dtype('U1').itemsize, length)
+        padded = np.char.rjust(base_ids, width, '0')
+        characters = padded.view('U1').reshape(len(base_ids), width)
+        suffixes = np.ascontiguousarray(characters[:, -length:]).view(f'U{length}').ravel()
+        return np.char.lstrip(suffixes, '0')
+
+    def __normalized_column(self, column: str) -> np.ndarray:
+        """Returns the column lowercased as a fixed width unicode array with missing values as ''.
+        Lowercasing happens in one numpy pass over the whole array
+        """
+        values: np.ndarray = self.__character_df[column].fillna('').astype(str).to_numpy(dtype=str)
+        return np.char.lower(values)
+
+    def __get_partial_id_rows(self, needle_base_id: str) -> set[int]:
+        """Partial IDs are compared using the last 5, 4 or 3 characters of the ID (or the whole ID if it is shorter).
+        Returns the rows of the longest partial ID that matches any row
+        """
         for length in [5, 4, 3]:
-            if partial_id_match.any():
-                break
-            partial_id_search = base_id[-length:].lstrip('0').lower()  # strip leading zeros from partial ID search
-            partial_id_match = vectorized_partial_id_match(self.character_df['base_id'], length) == partial_id_search
-
-        ordered_matchers = {
-            'name, ID, race': name_match & id_match & race_match, # match name, full ID, race (needed for Fallout 4 NPCs like Curie)
-            'name, ID': name_match & id_match, # match name and full ID
-            'name, partial ID, race': name_match & partial_id_match & race_match, # match name, partial ID, and race
-            'name, partial ID': name_match & partial_id_match, # match name and partial ID
-            'name, race': name_match & race_match, # match name and race
-            'name': name_match, # match just name
-            'ID': id_match # match just ID
-        }
+            if length not in self._by_id_suffix:
+                by_id_suffix = self.__group_row_indices(self.__id_suffixes(self._match_cols['base_id'], length))
+                for row_index, (base_id_lower, _, _) in self._row_keys.items(): # move added and changed rows to their current ID
+                    if row_index < len(self._match_cols['base_id']):
+                        self.__remove_from_group(by_id_suffix, self.__id_suffix(str(self._match_cols['base_id'][row_index]), length), row_index)
+                    by_id_suffix.setdefault(self.__id_suffix(base_id_lower, length), []).append(row_index)
+                self._by_id_suffix[length] = by_id_suffix
+            needle_partial_id = self.__id_suffix(needle_base_id, length)  # strip leading zeros from partial ID search
+            partial_id_rows = self._by_id_suffix[length].get(needle_partial_id)
+            if partial_id_rows:
+                return set(partial_id_rows)
+        return set()
 
-        for matcher in ordered_matchers:
-            view = self.character_df.loc[ordered_matchers[matcher]]
-            if view.shape[0] == 1: #If there is exactly one match
+    @staticmethod
+    def __group_row_indices(values: np.ndarray) -> dict[str, list[int]]:
+        groups: dict[str, list[int]] = {}
+        for row_index, value in enumerate(values.tolist()):
+            groups.setdefault(value, []).append(row_index)
+        return groups
+
+    @utils.time_it
+    def _get_matching_df_rows_matcher(self, base_id: str, character_name: str, race: str) -> int | None:
+        """Returns the position of the row in character_df that uniquely matches the character, or None if there is no unique match"""
+        # Normalize the search values once, the match index already holds normalized values
+        needle_base_id = base_id.lower()
+        needle_name = character_name.lower()
+        needle_race = race.lower()
+        
+        full_id_len = 6
+        needle_full_id = needle_base_id[-full_id_len:].lstrip('0')  # Strip leading zeros from the last 6 characters
+
+        # A unique name and full ID match is always the result of the 'name, ID, race' or 'name, ID' matcher
+        name_id_rows = self._by_name_id.get((needle_name, needle_full_id))
+        if name_id_rows and len(name_id_rows) == 1:
+            logging.info(f'Matched {character_name} in CSV by name, ID')
+            return name_id_rows[0]
+
+        id_rows: set[int] = set(self._by_id_full.get(needle_full_id, []))
+        name_rows: set[int] = set(self._by_name.get(needle_name, []))
+
+        partial_id_rows: set[int] | None = None
+        def get_partial_id_rows() -> set[int]:
+            nonlocal partial_id_rows
+            if partial_id_rows is None: # Only needed if neither of the full ID matchers found a unique match
+                partial_id_rows = self.__get_partial_id_rows(needle_base_id)
+            return partial_id_rows
+
+        race_rows: set[int] = self._by_race.get(needle_race, set())
+        def with_race(rows: set[int]) -> set[int]:
+            return rows & race_rows
+
+        # Candidates are only combined when the previous matcher did not give a unique result
+        ordered_matchers: list[tuple[str, Callable[[], set[int]]]] = [
+            ('name, ID, race', lambda: with_race(name_rows & id_rows)), # match name, full ID, race (needed for Fallout 4 NPCs like Curie)
+            ('name, ID', lambda: name_rows & id_rows), # match name and full ID
+            ('name, partial ID, race', lambda: with_race(name_rows & get_partial_id_rows())), # match name, partial ID, and race
+            ('name, partial ID', lambda: name_rows & get_partial_id_rows()), # match name and partial ID
+            ('name, race', lambda: with_race(name_rows)), # match name and race
+            ('name', lambda: name_rows), # match just name
+            ('ID', lambda: id_rows) # match just ID
+        ]
+
+        for matcher, get_rows in ordered_matchers:
+            rows = get_rows()
+            if len(rows) == 1: #If there is exactly one match
                 logging.info(f'Matched {character_name} in CSV by {matcher}')
-                return ordered_matchers[matcher]
+                return next(iter(rows))
             
         return None
 
     @utils.time_it
     def find_character_info(self, base_id: str, character_name: str, race: str, gender: int, ingame_voice_model: str):
+        cache_key = (base_id, character_name, race, gender, ingame_voice_model)
+        cached_info = self._info_cache.get(cache_key)
+        if cached_info is not None:
+            character_info, is_generic_npc = cached_info
+            return copy.copy(character_info), is_generic_npc
+
         character_race = race.split('<')[1].split('Race ')[0] # TODO: check if this covers "character_currentrace.split('<')[1].split('Race ')[0]" from FO4
-        matcher = self._get_matching_df_rows_matcher(base_id, character_name, character_race)
-        if isinstance(matcher, type(None)):
+        row_index = self._get_matching_df_rows_matcher(base_id, character_name, character_race)
+        if row_index is None:
             logging.info(f"Could not find {character_name} in {self.game_name_in_filepath}_characters.csv. Loading as a generic NPC.")
             character_info = self.load_unnamed_npc(character_name, character_race, gender, ingame_voice_model)
             is_generic_npc = True
         else:
-            result = self.character_df.loc[matcher]
-            character_info = result.to_dict('records')[0]
-            if (character_info['voice_model'] is None) or (pd.isnull(character_info['voice_model'])) or (character_info['voice_model'] == ''):
+            character_info = self.character_df.iloc[row_index].to_dict()
+            voice_model = character_info.get('voice_model')
+            if not voice_model or (isinstance(voice_model, float) and voice_model != voice_model): # None, '' or NaN
                 character_info['voice_model'] = self.find_best_voice_model(race, gender, ingame_voice_model) 
             is_generic_npc = False                                   
 
-        return character_info, is_generic_npc
+        self._info_cache[cache_key] = (character_info, is_generic_npc)
+        return copy.copy(character_info), is_generic_npc
     
     @utils.time_it
-    def __apply_character_overrides(self, overrides_folder: str, character_df_column_headers: list[str]):
-        os.makedirs(overrides_folder, exist_ok=True)
-        override_files: list[str] = os.listdir(overrides_folder)
+    def __apply_character_overrides(self, overrides_folder: Path, character_df_column_headers: list[str]):
+        overrides_folder.mkdir(parents=True, exist_ok=True)
+        new_rows: list[dict[str, Any]] = []
+        updates: dict[int, dict[str, Any]] = {}
+
+        def collect_override(name: str, base_id: str, race: str, row: dict[str, Any], changes: dict[str, Any]):
+            # The match index is updated right away, so later overrides find added and changed rows as if they had already been written
+            df_row_count = len(self.__character_df.index)
+            matched_row = self._get_matching_df_rows_matcher(base_id, name, race)
+            if matched_row is None: #character not in csv, add as new row
+                self.__index_row(df_row_count + len(new_rows), base_id.lower(), name.lower(), race.lower())
+                new_rows.append(row)
+                return
+            self.__reindex_row(matched_row, changes) # later overrides need to find the row by a changed name, ID or race
+            if matched_row >= df_row_count: #character has been added by a previous override, update it
+                new_rows[matched_row - df_row_count].update(changes)
+            else: #character is in csv, update row
+                updates.setdefault(matched_row, {}).update(changes)
+
+        with os.scandir(overrides_folder) as override_entries:
+            # Later files can refer to characters changed by earlier ones, so go through them in a fixed order
+            override_files: list[os.DirEntry] = sorted(override_entries, key=lambda entry: entry.name)
         for file in override_files:
             try:
-                filename, extension = os.path.splitext(file)
-                full_path_file = os.path.join(overrides_folder,file)
+                filename, extension = os.path.splitext(file.name)
+                full_path_file = file.path
                 if extension == ".json":
-                    with open(full_path_file) as fp:
-                        json_object = json.load(fp)
-                        if isinstance(json_object, dict):#Otherwise it is already a list
-                            json_object = [json_object]
-                        for json_content in json_object:
-                            content: dict[str, str] = json_content
-                            name = content.get("name", "")
-                            base_id = content.get("base_id", "")
-                            race = content.get("race", "")
-                            matcher = self._get_matching_df_rows_matcher(base_id, name, race)
-                            if isinstance(matcher, type(None)): #character not in csv, add as new row
-                                row = []
-                                for entry in character_df_column_headers:
-                                    value = content.get(entry, "")
-                                    row.append(value)
-                                self.character_df.loc[len(self.character_df.index)] = row
-                            else: #character is in csv, update row
-                                for entry in character_df_column_headers:
-                                    value = content.get(entry, None)
-                                    if value and value != "":
-                                        self.character_df.loc[matcher, entry] = value
+                    json_object = self.__load_json_file(full_path_file)
+                    if isinstance(json_object, dict):#Otherwise it is already a list
+                        json_object = [json_object]
+                    for json_content in json_object:
+                        content: dict[str, str] = json_content
+                        name = content.get("name", "")
+                        base_id = content.get("base_id", "")
+                        race = content.get("race", "")
+                        row = {entry: content.get(entry, "") for entry in character_df_column_headers}
+                        changes = {entry: value for entry in character_df_column_headers if (value := content.get(entry, None)) and value != ""}
+                        collect_override(name, base_id, race, row, changes)
                 elif extension == ".csv":
                     extra_df = self.__get_character_df(full_path_file)
-                    for i in range(extra_df.shape[0]):#for each row in df
-                        name = self.get_string_from_df(extra_df.iloc[i], "name")
-                        base_id = self.get_string_from_df(extra_df.iloc[i], "base_id")
-                        race = self.get_string_from_df(extra_df.iloc[i], "race")
-                        matcher = self._get_matching_df_rows_matcher(base_id, name, race)
-                        if isinstance(matcher, type(None)): #character not in csv, add as new row
-                            row = []
-                            for entry in character_df_column_headers:
-                                value = self.get_string_from_df(extra_df.iloc[i], entry)
-                                row.append(value)
-                            self.character_df.loc[len(self.character_df.index)] = row
-                        else: #character is in csv, update row
-                            for entry in character_df_column_headers:
-                                value = extra_df.iloc[i].get(entry, None)
-                                if value and not pd.isna(value) and value != "":
-                                    self.character_df.loc[matcher, entry] = value
+                    for record in extra_df.to_dict('records'):#for each row in df
+                        name = self.get_string_from_df(record, "name")
+                        base_id = self.get_string_from_df(record, "base_id")
+                        race = self.get_string_from_df(record, "race")
+                        row = {entry: self.get_string_from_df(record, entry) for entry in character_df_column_headers}
+                        changes = {entry: value for entry in character_df_column_headers if (value := record.get(entry, None)) and not pd.isna(value) and value != ""}
+                        collect_override(name, base_id, race, row, changes)
             except Exception as e:
-                logging.log(logging.WARNING, f"Could not load character override file '{file}' in '{overrides_folder}'. Most likely there is an error in the formating of the file. Error: {e}")
+                logging.log(logging.WARNING, f"Could not load character override file '{file.name}' in '{overrides_folder}'. Most likely there is an error in the formating of the file. Error: {e}")
+
+        # Apply all collected overrides at once, growing the DataFrame row by row is slow
+        for row_index, changes in updates.items(): # only write the changed cells of each row instead of aligning a patch against the whole DataFrame
+            for entry, value in changes.items():
+                self.__character_df.iat[row_index, self._col_pos[entry]] = value
+        if new_rows:
+            added_df = pd.DataFrame(new_rows, columns=character_df_column_headers)
+            self.__character_df = pd.concat([self.__character_df, added_df], ignore_index=True)
+            self._col_pos = {column: position for position, column in enumerate(self.__character_df.columns)}
+        if updates or new_rows:
+            self._prepare_match_index()
+            self._info_cache.clear()
+
+    @staticmethod
+    def __load_json_file(file_path: str) -> Any:
+        if orjson:
+            try:
+                return orjson.loads(Path(file_path).read_bytes())
+            except orjson.JSONDecodeError:
+                pass # orjson only reads plain utf-8, let the json module try the file with the default encoding
+        with open(file_path) as fp:
+            return json.load(fp)
 
     @utils.time_it
     def _create_all_voice_folders(self, mod_path: str, voice_folder_col: str):
@@ -313,8 +470,8 @@ class gameable(ABC):
 
     @staticmethod
     @utils.time_it
-    def get_string_from_df(iloc, column_name: str) -> str:
-        entry = iloc.get(column_name, "")
+    def get_string_from_df(row: pd.Series | dict[str, Any], column_name: str) -> str:
+        entry = row.get(column_name, "")
         if pd.isna(entry): entry = ""
         elif not isinstance(entry, str): entry = str(entry)
         return entry        
@@ -4,6 +4,7 @@ import re
 import string
 import sys
 import os
+import codecs
 from shutil import rmtree
 from charset_normalizer import detect
 import winsound
@@ -70,10 +71,29 @@ def play_error_sound():
         pass
 
 
+# UTF-32 BOMs need to be checked before UTF-16 ones as they start with the same bytes
+_BOM_ENCODINGS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
 @time_it
 def get_file_encoding(file_path) -> str | None:
     with open(file_path,'rb') as f:
         data = f.read()
+    for bom, bom_encoding in _BOM_ENCODINGS:
+        if data.startswith(bom):
+            return bom_encoding
+    try:
+        # Decoding is much cheaper than detection, if the whole file is valid utf-8 (or ascii) there is nothing to detect
+        data.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
     encoding = detect(data).get("encoding")
     if isinstance(encoding, str):
         return encoding
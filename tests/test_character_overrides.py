@@ -0,0 +1,112 @@
+import json
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from src.games.gameable import gameable
+
+
+CHARACTERS_CSV = """name,voice_model,bio,base_id,race
+Avald Raven-Hand,MaleNordCommander,avald bio,000801,Nord
+Lydia,FemaleEvenToned,lydia bio,0A2C8E,Nord
+Lydia,FemaleEvenToned,other lydia bio,0C0C0C,Nord
+"""
+
+
+class override_test_game(gameable):
+    """Minimal game that only implements what is needed to load the characters CSV and its overrides"""
+    @property
+    def game_name_in_filepath(self) -> str:
+        return 'test'
+
+    @property
+    def extender_name(self) -> str:
+        return 'SKSE'
+
+    @property
+    def image_path(self) -> str:
+        return ''
+
+    def modify_sentence_text_for_game(self, text: str) -> str:
+        return text
+
+    def load_external_character_info(self, base_id: str, name: str, race: str, gender: int, actor_voice_model_name: str):
+        pass
+
+    def prepare_sentence_for_game(self, queue_output, context_of_conversation, config, topicID: int, isFirstLine: bool):
+        pass
+
+    def is_sentence_allowed(self, text: str, count_sentence_in_text: int) -> bool:
+        return True
+
+    def load_unnamed_npc(self, name: str, actor_race: str, actor_sex: int, ingame_voice_model: str) -> dict[str, Any]:
+        return {'name': name, 'voice_model': 'generic'}
+
+    def get_weather_description(self, weather_attributes: dict[str, Any]) -> str:
+        return ''
+
+    def find_best_voice_model(self, actor_race: str, actor_sex: int, ingame_voice_model: str, library_search: bool = True) -> str:
+        return 'best'
+
+
+@pytest.fixture
+def load_game(tmp_path: Path):
+    def load(override_files: dict[str, str]) -> override_test_game:
+        characters_csv = tmp_path / 'characters.csv'
+        characters_csv.write_text(CHARACTERS_CSV, encoding='utf-8')
+        overrides_folder = tmp_path / 'mod' / 'SKSE' / 'Plugins' / 'MantellaSoftware' / 'data' / 'Test' / 'character_overrides'
+        overrides_folder.mkdir(parents=True)
+        for file_name, content in override_files.items():
+            (overrides_folder / file_name).write_text(content, encoding='utf-8')
+        config = SimpleNamespace(game='Skyrim', mod_path_base=str(tmp_path / 'mod'), save_folder=str(tmp_path / 'save') + '/')
+        return override_test_game(config, str(characters_csv), 'Test')
+    return load
+
+
+def test_renamed_character_is_found_by_new_name_in_later_file(load_game):
+    game = load_game({
+        'a.json': json.dumps({'name': 'Zorblax', 'base_id': 'FE000801', 'race': 'Nord', 'bio': 'zbio'}),
+        'b.csv': 'name,base_id,race,bio\nZorblax,,Nord,zbio2\n',
+    })
+
+    characters = game.character_df
+    assert len(characters) == 3
+    zorblax = characters.loc[characters['name'] == 'Zorblax']
+    assert len(zorblax) == 1
+    assert zorblax.iloc[0]['base_id'] == 'FE000801'
+    assert zorblax.iloc[0]['bio'] == 'zbio2'
+
+    character_info, is_generic_npc = game.find_character_info('', 'Zorblax', '<NordRace (1)>', 0, '<x (1)>')
+    assert not is_generic_npc
+    assert character_info['bio'] == 'zbio2'
+
+
+def test_renamed_new_character_is_found_by_new_name_in_later_file(load_game):
+    game = load_game({
+        'a.json': json.dumps([{'name': 'Zorb', 'base_id': '0DDD01', 'race': 'Orc', 'bio': 'zorb'},
+                              {'name': 'Zorb2', 'base_id': '0DDD01'}]),
+        'b.csv': 'name,base_id,race,bio\nZorb2,,Orc,zorb2 bio\n',
+    })
+
+    characters = game.character_df
+    assert len(characters) == 4
+    assert not (characters['name'] == 'Zorb').any()
+    zorb2 = characters.loc[characters['name'] == 'Zorb2']
+    assert len(zorb2) == 1
+    assert zorb2.iloc[0]['base_id'] == '0DDD01'
+    assert zorb2.iloc[0]['bio'] == 'zorb2 bio'
+
+
+def test_character_with_changed_race_is_found_by_new_race(load_game):
+    game = load_game({
+        'a.json': json.dumps([{'name': 'Lydia', 'base_id': '0A2C8E', 'race': 'Breton'},
+                              {'name': 'Lydia', 'base_id': '', 'race': 'Breton', 'bio': 'breton lydia'}]),
+    })
+
+    characters = game.character_df
+    assert len(characters) == 3
+    lydia = characters.loc[characters['base_id'] == '0A2C8E']
+    assert lydia.iloc[0]['race'] == 'Breton'
+    assert lydia.iloc[0]['bio'] == 'breton lydia'